@@ -1,13 +1,76 @@
+from __future__ import annotations
+
 import re
+from collections.abc import Iterator
 from html import unescape
+
 from bs4 import BeautifulSoup
+from bs4.element import CData, NavigableString, PageElement, Tag
+
+# Парсер на C (libxml2), если доступен, иначе встроенный
+try:
+    import lxml  # type: ignore[import-untyped]  # noqa: F401
+
+    _PARSER = "lxml"
+except ImportError:
+    _PARSER = "html.parser"
+
+# Опциональный быстрый парсер (lexbor на C)
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None  # type: ignore[assignment,misc]
+
+# Предкомпилированные регулярные выражения
+_RE_MULTINL = re.compile(r"\n\s*\n\s*\n")
+_RE_MULTISPACE = re.compile(r"[ ]{2,}")
+_ATTACH_RE = re.compile(r"attachment|вложение|файл|download|скачать", re.IGNORECASE)
+# Ссылка в текстовом теле от Graph: "текст<url>" (текст - с начала строки
+# или после предыдущей ссылки)
+_TEXT_LINK_RE = re.compile(r"([^<>\n]*)<([a-z][a-z0-9+.-]*:[^<>\s]+)>", re.IGNORECASE)
+
+# Теги, которые требуют полного разбора: влияют на разметку текста
+# или содержат нечитаемый текст (стили, скрипты, head)
+_STRUCTURAL_RE = re.compile(
+    r"<(?:table|ul|ol|h[1-6]|a\s|img|br|p[\s/>]|div[\s/>]"
+    r"|script|style|head|noscript|iframe)",
+    re.IGNORECASE,
+)
+_TAG_STRIP_RE = re.compile(r"<[a-zA-Z/!][^>]*>")
+# Комментарии (в т.ч. условные комментарии Outlook) и незакрытый комментарий
+_COMMENT_RE = re.compile(r"<!--.*?(?:-->|$)", re.DOTALL)
+
+# Теги, которые не несут читаемого текста письма
+_UNWANTED_TAGS: list[str] = [
+    "script",
+    "style",
+    "meta",
+    "link",
+    "noscript",
+    "iframe",
+    "head",
+]
+
+# Префиксы заголовков и блочные теги, внутри которых div не оборачивается
+_HEADING_MAP: dict[str, str] = {
+    "h1": "====== ",
+    "h2": "===== ",
+    "h3": "==== ",
+    "h4": "=== ",
+    "h5": "== ",
+    "h6": "= ",
+}
+_LIST_NAMES: tuple[str, ...] = ("ul", "ol")
+_BLOCK_CHILD_NAMES: frozenset[str] = frozenset(
+    {"p", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "table"}
+)
 
 
 class HTMLToTextConverter:
     """Конвертер HTML в читаемый текст с сохранением структуры"""
 
     @staticmethod
-    def convert(html_content):
+    def convert(html_content: str) -> str:
         """
         Конвертирует HTML в читаемый текст с сохранением структуры
 
@@ -23,94 +86,115 @@ class HTMLToTextConverter:
         # Декодируем HTML entities
         cleaned_html = unescape(html_content)
 
-        # Используем BeautifulSoup для парсинга
-        soup = BeautifulSoup(cleaned_html, "html.parser")
+        # Без структурных тегов достаточно убрать разметку, парсер не нужен
+        if not _STRUCTURAL_RE.search(cleaned_html):
+            return HTMLToTextConverter._strip_tags(cleaned_html)
 
-        # Удаляем ненужные теги
-        for unwanted in soup(["script", "style", "meta", "link"]):
-            unwanted.decompose()
+        document = HTMLToTextConverter._parse(cleaned_html)
+        return HTMLToTextConverter._convert_document(document)
+
+    @staticmethod
+    def convert_with_attachments(html_content: str) -> tuple[str, list[dict[str, str]]]:
+        """
+        Конвертирует HTML в текст и извлекает упоминания вложений за один разбор
+
+        Args:
+            html_content (str): HTML контент для конвертации
 
-        # Обрабатываем заголовки
-        HTMLToTextConverter._process_headings(soup)
+        Returns:
+            tuple: Читаемый текст и список упомянутых вложений
+        """
+        if not html_content:
+            return "", []
 
-        # Обрабатываем списки
-        HTMLToTextConverter._process_lists(soup)
+        # Декодируем HTML entities
+        cleaned_html = unescape(html_content)
 
-        # Обрабатываем таблицы
-        HTMLToTextConverter._process_tables(soup)
+        # Без структурных тегов нет и ссылок на вложения
+        if not _STRUCTURAL_RE.search(cleaned_html):
+            return HTMLToTextConverter._strip_tags(cleaned_html), []
 
-        # Обрабатываем ссылки
-        HTMLToTextConverter._process_links(soup)
+        document = HTMLToTextConverter._parse(cleaned_html)
 
-        # Обрабатываем параграфы и переносы
-        HTMLToTextConverter._process_paragraphs(soup)
+        # Ссылки собираем до конвертации, которая изменяет дерево
+        attachments = HTMLToTextConverter._find_attachments(document)
 
-        # Получаем текст и финализируем форматирование
-        text = soup.get_text()
-        text = HTMLToTextConverter._finalize_formatting(text)
+        return HTMLToTextConverter._convert_document(document), attachments
+
+    @staticmethod
+    def _strip_tags(cleaned_html: str) -> str:
+        """Удаляет теги из HTML без структурной разметки"""
+        text = _TAG_STRIP_RE.sub("", _COMMENT_RE.sub("", cleaned_html))
+        return HTMLToTextConverter._finalize_formatting(text).strip()
+
+    @staticmethod
+    def _parse(html: str) -> BeautifulSoup | LexborHTMLParser:
+        """Разбирает HTML самым быстрым доступным парсером"""
+        if LexborHTMLParser is not None:
+            return LexborHTMLParser(html)
+        return BeautifulSoup(html, _PARSER)
+
+    @staticmethod
+    def _convert_document(document: BeautifulSoup | LexborHTMLParser) -> str:
+        """Конвертирует разобранный документ в читаемый текст"""
+        if not isinstance(document, BeautifulSoup):
+            return HTMLToTextConverter._convert_selectolax(document)
+
+        # Удаляем ненужные теги (extract дешевле decompose: поддерево не разбирается)
+        for unwanted in document(_UNWANTED_TAGS):
+            unwanted.extract()
+
+        # Обходим дерево один раз, собирая текст по частям
+        out: list[str] = []
+        HTMLToTextConverter._walk(document, out)
+        text = HTMLToTextConverter._finalize_formatting("".join(out))
 
         return text.strip()
 
     @staticmethod
-    def _process_headings(soup):
-        """Обрабатывает заголовки"""
-        heading_map = {
-            "h1": "====== ",
-            "h2": "===== ",
-            "h3": "==== ",
-            "h4": "=== ",
-            "h5": "== ",
-            "h6": "= ",
-        }
-
-        for tag, prefix in heading_map.items():
-            for heading in soup.find_all(tag):
-                heading_text = heading.get_text().strip()
+    def _convert_selectolax(tree: LexborHTMLParser) -> str:
+        """
+        Быстрая конвертация через selectolax с той же структурой текста,
+        что и у пути на BeautifulSoup
+
+        Args:
+            tree (LexborHTMLParser): Разобранный документ, изменяется на месте
+
+        Returns:
+            str: Читаемый текст с сохраненной структурой
+        """
+        # Удаляем ненужные теги вместе с содержимым
+        tree.strip_tags(_UNWANTED_TAGS)
+
+        # Заголовки
+        for tag, prefix in _HEADING_MAP.items():
+            for heading in tree.css(tag):
+                heading_text = heading.text().strip()
                 if heading_text:
                     heading.replace_with(
                         f"\n\n{prefix}{heading_text.upper()}\n{prefix.replace(' ', '=')}\n"
                     )
 
-    @staticmethod
-    def _process_lists(soup):
-        """Обрабатывает упорядоченные и неупорядоченные списки"""
-        # Неупорядоченные списки
-        for ul in soup.find_all("ul"):
-            list_items = []
-            for li in ul.find_all("li"):
-                item_text = li.get_text().strip()
-                if item_text:
-                    list_items.append(f"  • {item_text}")
-
-            if list_items:
-                ul.replace_with("\n" + "\n".join(list_items) + "\n")
-            else:
-                ul.decompose()
-
-        # Упорядоченные списки
-        for ol in soup.find_all("ol"):
-            list_items = []
-            for i, li in enumerate(ol.find_all("li"), 1):
-                item_text = li.get_text().strip()
-                if item_text:
-                    list_items.append(f"  {i}. {item_text}")
-
-            if list_items:
-                ol.replace_with("\n" + "\n".join(list_items) + "\n")
-            else:
-                ol.decompose()
+        # Списки
+        for list_tag in ("ul", "ol"):
+            for list_node in tree.css(list_tag):
+                list_items = []
+                for i, li in enumerate(list_node.css("li"), 1):
+                    item_text = li.text().strip()
+                    if item_text:
+                        marker = "•" if list_tag == "ul" else f"{i}."
+                        list_items.append(f"  {marker} {item_text}")
+
+                if list_items:
+                    list_node.replace_with("\n" + "\n".join(list_items) + "\n")
+                else:
+                    list_node.remove()
 
-    @staticmethod
-    def _process_tables(soup):
-        """Обрабатывает таблицы в текстовом формате"""
-        for table in soup.find_all("table"):
+        # Таблицы
+        for table in tree.css("table"):
             rows = []
-            for tr in table.find_all("tr"):
-                row_cells = []
-                for cell in tr.find_all(["td", "th"]):
-                    cell_text = cell.get_text().strip()
-                    row_cells.append(cell_text)
-
+            for tr in table.css("tr"):
+                row_cells = [cell.text().strip() for cell in tr.css("td, th")]
                 if row_cells:
                     rows.append(" | ".join(row_cells))
 
@@ -118,59 +202,250 @@ class HTMLToTextConverter:
                 table_content = "\n".join([f"  {row}" for row in rows])
                 table.replace_with(f"\n{table_content}\n")
             else:
-                table.decompose()
+                table.remove()
 
-    @staticmethod
-    def _process_links(soup):
-        """Обрабатывает ссылки, сохраняя их как текст с URL"""
-        for link in soup.find_all("a", href=True):
-            link_text = link.get_text().strip()
-            link_url = link["href"].strip()
+        # Ссылки
+        for link in tree.css("a[href]"):
+            link_text = link.text().strip()
+            link_url = (link.attributes.get("href") or "").strip()
 
-            if link_text and link_url:
-                if link_text != link_url:
-                    link.replace_with(f"{link_text} [{link_url}]")
-                else:
-                    link.replace_with(link_url)
-            elif link_text:
-                link.replace_with(link_text)
-            elif link_url:
-                link.replace_with(link_url)
+            if link_text and link_url and link_text != link_url:
+                link.replace_with(f"{link_text} [{link_url}]")
+            elif link_url or link_text:
+                link.replace_with(link_url or link_text)
             else:
-                link.decompose()
+                link.remove()
 
-    @staticmethod
-    def _process_paragraphs(soup):
-        """Обрабатывает параграфы и переносы строк"""
-        for br in soup.find_all("br"):
+        # Параграфы и переносы
+        for br in tree.css("br"):
             br.replace_with("\n")
 
-        for p in soup.find_all("p"):
-            p_text = p.get_text().strip()
+        for p in tree.css("p"):
+            p_text = p.text().strip()
             if p_text:
                 p.replace_with(f"\n{p_text}\n")
             else:
-                p.decompose()
-
-        for div in soup.find_all("div"):
-            div_text = div.get_text().strip()
-            if div_text:
-                # Проверяем, не является ли div контейнером без собственного текста
-                if not any(
-                    child.name
-                    in ["p", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "table"]
-                    for child in div.children
+                p.remove()
+
+        for div in tree.css("div"):
+            div_text = div.text().strip()
+            if div_text and not any(
+                child.tag in _BLOCK_CHILD_NAMES
+                for child in div.iter(include_text=False)
+            ):
+                div.replace_with(f"\n{div_text}\n")
+
+        text = tree.root.text() if tree.root else ""
+        text = HTMLToTextConverter._finalize_formatting(text)
+
+        return text.strip()
+
+    @staticmethod
+    def _walk(node: Tag, out: list[str]) -> None:
+        """
+        Обходит дерево без рекурсии (глубина вложенности не ограничена стеком
+        вызовов) и добавляет в out текст с разметкой заголовков, списков,
+        таблиц, ссылок, параграфов и переносов
+
+        Args:
+            node: Узел BeautifulSoup
+            out (list): Список, в который добавляются части текста
+        """
+        # Кадр: дети узла, список для текста, имя блока (p/div) и список
+        # родителя, куда попадет обернутый текст блока, признаки нахождения
+        # внутри параграфа и внутри обернутого div
+        stack: list[
+            tuple[Iterator[PageElement], list[str], str, list[str], bool, bool]
+        ] = [(iter(node.children), out, "", out, False, False)]
+
+        while stack:
+            children, parts, block, parent_parts, in_p, in_div = stack[-1]
+            child = next(children, None)
+
+            if child is None:
+                stack.pop()
+                if block:
+                    block_text = "".join(parts).strip()
+                    if block_text:
+                        parent_parts.append(f"\n{block_text}\n")
+                    elif block == "div":
+                        parent_parts.extend(parts)
+                continue
+
+            if not isinstance(child, Tag):
+                if type(child) in (NavigableString, CData):
+                    parts.append(str(child))
+                continue
+
+            name = child.name
+
+            if name in _HEADING_MAP:
+                heading = HTMLToTextConverter._format_heading(child)
+                if heading:
+                    parts.append(heading)
+                else:
+                    # В пустом заголовке остаются ссылки без текста и переносы
+                    stack.append(
+                        (iter(child.children), parts, "", parent_parts, in_p, in_div)
+                    )
+
+            elif name == "ul" or name == "ol":
+                parts.append(HTMLToTextConverter._format_list(child))
+
+            elif name == "table":
+                parts.append(HTMLToTextConverter._format_table(child))
+
+            elif name == "a" and child.has_attr("href"):
+                link_text = child.get_text().strip()
+                link_url = str(child["href"]).strip()
+
+                if link_text and link_url and link_text != link_url:
+                    parts.append(f"{link_text} [{link_url}]")
+                else:
+                    parts.append(link_url or link_text)
+
+            elif name == "br":
+                parts.append("\n")
+
+            # Параграф оборачивается целиком; вложенные в него p и div,
+            # как и div внутри обернутого div, переносов не добавляют
+            elif name == "p" and not in_p:
+                stack.append((iter(child.children), [], "p", parts, True, True))
+
+            elif name == "div" and not in_div:
+                # Контейнер с пустым заголовком не оборачиваем, его дочерние
+                # div оборачиваются по отдельности
+                if any(
+                    isinstance(grandchild, Tag)
+                    and grandchild.name in _HEADING_MAP
+                    and not grandchild.get_text().strip()
+                    for grandchild in child.children
                 ):
-                    div.replace_with(f"\n{div_text}\n")
+                    stack.append(
+                        (iter(child.children), parts, "", parent_parts, in_p, in_div)
+                    )
+                else:
+                    stack.append((iter(child.children), [], "div", parts, in_p, True))
+
+            else:
+                stack.append(
+                    (iter(child.children), parts, "", parent_parts, in_p, in_div)
+                )
 
     @staticmethod
-    def _finalize_formatting(text):
+    def _format_heading(heading: Tag) -> str:
+        """Оформляет заголовок; для пустого заголовка возвращает пустую строку"""
+        heading_text = heading.get_text().strip()
+        if not heading_text:
+            return ""
+        prefix = _HEADING_MAP[heading.name]
+        return f"\n\n{prefix}{heading_text.upper()}\n{prefix.replace(' ', '=')}\n"
+
+    @staticmethod
+    def _format_list(list_node: Tag) -> str:
+        """
+        Оформляет список маркерами; для пустого списка возвращает пустую строку.
+        Как и в исходном порядке обработки, ul оформляются раньше ol: пункты
+        вложенного в ol списка ul не попадают в ol, а его текст уже оформлен
+        """
+        nested: tuple[str, ...] = ("ul",) if list_node.name == "ol" else ()
+        list_items = []
+        for i, li in enumerate(
+            HTMLToTextConverter._find_outside(list_node, "li", nested), 1
+        ):
+            item_text = HTMLToTextConverter._flat_text(li, nested).strip()
+            if item_text:
+                marker = "•" if list_node.name == "ul" else f"{i}."
+                list_items.append(f"  {marker} {item_text}")
+
+        if not list_items:
+            return ""
+        return "\n" + "\n".join(list_items) + "\n"
+
+    @staticmethod
+    def _format_table(table: Tag) -> str:
+        """
+        Оформляет таблицу построчно; для пустой таблицы возвращает пустую
+        строку. Списки оформляются раньше таблиц, поэтому строки и ячейки
+        внутри списков не учитываются, а списки в ячейках уже оформлены
+        """
+        rows = []
+        for tr in HTMLToTextConverter._find_outside(table, "tr", _LIST_NAMES):
+            row_cells = [
+                HTMLToTextConverter._flat_text(cell, _LIST_NAMES).strip()
+                for cell in HTMLToTextConverter._find_outside(
+                    tr, ("td", "th"), _LIST_NAMES
+                )
+            ]
+            if row_cells:
+                rows.append(" | ".join(row_cells))
+
+        if not rows:
+            return ""
+        table_content = "\n".join([f"  {row}" for row in rows])
+        return f"\n{table_content}\n"
+
+    @staticmethod
+    def _find_outside(
+        node: Tag, names: str | tuple[str, ...], skip: tuple[str, ...]
+    ) -> list[Tag]:
+        """
+        Как find_all(names), но не заходит внутрь потомков с именами из skip
+
+        Args:
+            node: Узел, среди потомков которого идет поиск
+            names: Имя или имена искомых тегов
+            skip (tuple): Имена тегов, чье содержимое пропускается
+        """
+        found = []
+        stack: list[Iterator[PageElement]] = [iter(node.children)]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+            elif isinstance(child, Tag) and child.name not in skip:
+                if child.name in names:
+                    found.append(child)
+                stack.append(iter(child.children))
+
+        return found
+
+    @staticmethod
+    def _flat_text(node: Tag, lists: tuple[str, ...]) -> str:
+        """
+        Текст узла как get_text(), но с оформленными заголовками и списками
+        из lists, как после соответствующих шагов исходной обработки
+
+        Args:
+            node: Пункт списка или ячейка таблицы
+            lists (tuple): Имена списков (ul, ol), которые уже оформлены
+        """
+        parts: list[str] = []
+        stack: list[Iterator[PageElement]] = [iter(node.children)]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+            elif not isinstance(child, Tag):
+                if type(child) in (NavigableString, CData):
+                    parts.append(str(child))
+            elif child.name in _HEADING_MAP and child.get_text().strip():
+                parts.append(HTMLToTextConverter._format_heading(child))
+            elif child.name in lists:
+                parts.append(HTMLToTextConverter._format_list(child))
+            else:
+                stack.append(iter(child.children))
+
+        return "".join(parts)
+
+    @staticmethod
+    def _finalize_formatting(text: str) -> str:
         """Финализирует форматирование текста"""
         # Заменяем множественные пустые строки
-        text = re.sub(r"\n\s*\n\s*\n", "\n\n", text)
+        text = _RE_MULTINL.sub("\n\n", text)
 
         # Заменяем множественные пробелы
-        text = re.sub(r"[ ]{2,}", " ", text)
+        text = _RE_MULTISPACE.sub(" ", text)
 
         # Очищаем пробелы в начале и конце строк
         lines = [line.strip() for line in text.split("\n")]
@@ -182,7 +457,7 @@ class HTMLToTextConverter:
         return text
 
     @staticmethod
-    def extract_attachments_info(html_content):
+    def extract_attachments_info(html_content: str) -> list[dict[str, str]]:
         """
         Извлекает информацию о вложениях из HTML (если есть упоминания)
 
@@ -195,19 +470,58 @@ class HTMLToTextConverter:
         if not html_content:
             return []
 
-        soup = BeautifulSoup(html_content, "html.parser")
-        attachments = []
+        document = HTMLToTextConverter._parse(html_content)
+        return HTMLToTextConverter._find_attachments(document)
 
+    @staticmethod
+    def _find_attachments(
+        document: BeautifulSoup | LexborHTMLParser,
+    ) -> list[dict[str, str]]:
+        """Ищет ссылки на вложения в разобранном документе"""
         # Ищем упоминания о вложениях (обычно в виде ссылок на файлы)
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            text = link.get_text().strip().lower()
+        if isinstance(document, BeautifulSoup):
+            links = [
+                (link.get_text(), str(link["href"]))
+                for link in document.find_all("a", href=True)
+            ]
+        else:
+            links = [
+                (link.text(), link.attributes.get("href") or "")
+                for link in document.css("a[href]")
+            ]
+
+        return HTMLToTextConverter._match_attachments(links)
+
+    @staticmethod
+    def extract_attachments_from_text(text_content: str) -> list[dict[str, str]]:
+        """
+        Извлекает информацию о вложениях из текстового тела письма
+
+        Graph при Prefer: outlook.body-content-type="text" записывает ссылку
+        как "текст<url>", поэтому ищутся такие пары.
+
+        Args:
+            text_content (str): Текстовое тело письма
 
+        Returns:
+            list: Список упомянутых вложений
+        """
+        if not text_content:
+            return []
+
+        links = [
+            (match.group(1), match.group(2))
+            for match in _TEXT_LINK_RE.finditer(text_content)
+        ]
+        return HTMLToTextConverter._match_attachments(links)
+
+    @staticmethod
+    def _match_attachments(links: list[tuple[str, str]]) -> list[dict[str, str]]:
+        """Отбирает из пар (текст, url) ссылки, похожие на вложения"""
+        attachments = []
+        for text, href in links:
             # Проверяем, похоже ли на ссылку на вложение
-            if any(
-                keyword in text
-                for keyword in ["attachment", "вложение", "файл", "download", "скачать"]
-            ):
-                attachments.append({"name": link.get_text().strip(), "url": href})
+            if _ATTACH_RE.search(text):
+                attachments.append({"name": text.strip(), "url": href})
 
         return attachments
@@ -1,7 +1,14 @@
 import os
+import sys
 import msal
+import orjson
 import requests
 import json
+import time
+from dataclasses import dataclass
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -22,28 +29,104 @@ SCOPES = [
 ]
 CACHE_FILE = "token_cache.bin"
 MAILBOX = "me"
+TOKEN_REFRESH_MARGIN = 60  # секунд до истечения, когда токен обновляется
+BATCH_ENDPOINT = "https://graph.microsoft.com/v1.0/$batch"
+PAGE_SIZE = 100  # писем на страницу при постраничной выборке
+BATCH_LIMIT = 20  # максимум подзапросов в одном $batch
+BATCH_RETRIES = 3  # повторов затроттленных (429) подзапросов $batch
+BATCH_RETRY_DELAY = 1  # секунд ожидания, если Graph не прислал Retry-After
+# Просим Graph отдавать тело письма сразу в виде текста
+PREFER_TEXT_BODY = 'outlook.body-content-type="text"'
+# Поля писем в списках папок и результатах поиска
+LISTING_FIELDS = "id,subject,from,receivedDateTime,isRead,hasAttachments"
+EMAIL_CONTENT_FIELDS = "id,subject,from,toRecipients,ccRecipients,bccRecipients,body,receivedDateTime,bodyPreview,hasAttachments,importance"
+# Общий пустой словарь для цепочек .get() вместо нового {} на каждый вызов
+_EMPTY = {}
 
 # Инициализация кэша токенов
 cache = msal.SerializableTokenCache()
-if os.path.exists(CACHE_FILE):
-    cache.deserialize(open(CACHE_FILE, "r").read())
+if os.path.exists(CACHE_FILE) and os.path.getsize(CACHE_FILE) > 0:
+    with open(CACHE_FILE, "rb") as f:
+        cache.deserialize(f.read().decode("utf-8"))
 
 app = msal.PublicClientApplication(CLIENT_ID, authority=AUTHORITY, token_cache=cache)
 
 
+def _make_session(retry):
+    """Создает HTTP-сессию с пулом соединений и заданной политикой повторов"""
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry),
+    )
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+# Общая HTTP-сессия: keep-alive и пул соединений к graph.microsoft.com.
+# Повторы с экспоненциальной задержкой при троттлинге и сбоях Graph,
+# с учетом заголовка Retry-After. POST здесь только для $batch
+# с идемпотентными подзапросами (GET, DELETE)
+SESSION = _make_session(
+    Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+        allowed_methods=["GET", "POST", "DELETE"],
+        raise_on_status=False,
+    )
+)
+
+# Сессия для неидемпотентных POST (sendMail, move): повтор только при
+# троттлинге (429/503), когда Graph запрос не выполнил. После 5xx или
+# обрыва чтения запрос мог быть выполнен, и повтор отправил бы письмо дважды
+SEND_SESSION = _make_session(
+    Retry(
+        total=5,
+        read=False,
+        backoff_factor=0.5,
+        status_forcelist=[429, 503],
+        respect_retry_after_header=True,
+        allowed_methods=["POST"],
+        raise_on_status=False,
+    )
+)
+
+
+# Последний полученный токен в памяти процесса
+_TOKEN_CACHE = {"result": None, "expires_at": 0}
+
+
 def save_cache():
     """Сохраняет кэш токенов"""
     if cache.has_state_changed:
-        with open(CACHE_FILE, "w") as f:
-            f.write(cache.serialize())
+        # Пишем во временный файл и атомарно подменяем, чтобы не оставить
+        # поврежденный кэш при прерывании записи
+        tmp_file = CACHE_FILE + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(cache.serialize().encode("utf-8"))
+        os.replace(tmp_file, CACHE_FILE)
+
+
+def _remember_token(result):
+    """Запоминает токен в памяти до истечения его срока действия"""
+    if "access_token" in result:
+        _TOKEN_CACHE["result"] = result
+        _TOKEN_CACHE["expires_at"] = time.monotonic() + int(result.get("expires_in", 0))
 
 
 def acquire_token():
     """Получает токен доступа"""
+    if time.monotonic() < _TOKEN_CACHE["expires_at"] - TOKEN_REFRESH_MARGIN:
+        return _TOKEN_CACHE["result"]
+
     accounts = app.get_accounts()
     if accounts:
         result = app.acquire_token_silent(SCOPES, account=accounts[0])
         if result:
+            _remember_token(result)
+            save_cache()
             return result
 
     flow = app.initiate_device_flow(scopes=SCOPES)
@@ -52,10 +135,35 @@ def acquire_token():
 
     print(flow["message"])
     result = app.acquire_token_by_device_flow(flow)
+    _remember_token(result)
     save_cache()
     return result
 
 
+def current_access_token():
+    """
+    Возвращает действующий токен доступа или None, если войти не удалось
+
+    Вызывается непосредственно перед запросом к Graph: пока пользователь
+    заполняет поля меню, ранее полученный токен может истечь.
+    """
+    try:
+        result = acquire_token()
+    except ValueError as e:
+        print(f"❌ Authentication failed: {str(e)}")
+        return None
+
+    if "access_token" not in result:
+        print(
+            "❌ Authentication failed:",
+            result.get("error"),
+            result.get("error_description"),
+        )
+        return None
+
+    return result["access_token"]
+
+
 def send_mail(
     access_token, subject, body, to_recipients, cc_recipients=None, save_to_sent=True
 ):
@@ -84,127 +192,170 @@ def send_mail(
         "Content-Type": "application/json",
     }
 
-    try:
-        response = requests.post(endpoint, json=email_msg, headers=headers)
-        if response.status_code == 202:
-            print("✅ Email sent successfully!")
-            return True
-        else:
-            print(f"❌ Failed to send email: {response.status_code} - {response.text}")
-            return False
-    except Exception as e:
-        print(f"❌ Error sending email: {str(e)}")
+    response = SEND_SESSION.post(endpoint, json=email_msg, headers=headers)
+    if response.status_code == 202:
+        print("✅ Email sent successfully!")
+        return True
+    else:
+        print(f"❌ Failed to send email: {response.status_code} - {response.text}")
         return False
 
 
+def _paged_get(access_token, url, params=None):
+    """
+    Постранично получает коллекцию Graph, следуя по @odata.nextLink
+
+    Args:
+        access_token (str): Токен доступа
+        url (str): Адрес коллекции
+        params (dict): Параметры первого запроса
+
+    Yields:
+        dict: Элементы коллекции по одному, страницы запрашиваются по мере чтения
+
+    Raises:
+        requests.HTTPError: Если Graph вернул ошибку
+    """
+    headers = {"Authorization": "Bearer " + access_token}
+
+    while url:
+        response = SESSION.get(url, headers=headers, params=params)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        yield from data.get("value", [])
+
+        # nextLink уже содержит все параметры запроса
+        url = data.get("@odata.nextLink")
+        params = None
+
+
+def _take(access_token, url, params, top):
+    """
+    Лениво возвращает не более top элементов коллекции Graph
+
+    Размер страницы ($top) подбирается под top, но не больше PAGE_SIZE;
+    при top <= 0 запросы к Graph не выполняются.
+    """
+    top = max(top, 0)
+    params = {**params, "$top": min(top, PAGE_SIZE)}
+    return islice(_paged_get(access_token, url, params), top)
+
+
 def get_emails(access_token, top=10, folder="inbox"):
     """Получает список писем из указанной папки"""
     endpoint = (
         f"https://graph.microsoft.com/v1.0/{MAILBOX}/mailFolders/{folder}/messages"
     )
-    params = {
-        "$top": top,
-        "$orderby": "receivedDateTime DESC",
-        "$select": "id,subject,from,receivedDateTime,isRead,hasAttachments",
-    }
-
-    headers = {"Authorization": "Bearer " + access_token}
+    params = {"$orderby": "receivedDateTime DESC", "$select": LISTING_FIELDS}
 
+    emails = []
     try:
-        response = requests.get(endpoint, headers=headers, params=params)
-        if response.status_code == 200:
-            emails = response.json().get("value", [])
-            print(f"\n📥 Found {len(emails)} emails in {folder}:")
-
-            for i, email in enumerate(emails, 1):
-                read_status = "📖" if email.get("isRead", False) else "📨"
-                attachment_status = "📎" if email.get("hasAttachments", False) else ""
-                from_info = email.get("from", {}).get("emailAddress", {})
-                from_address = from_info.get("address", "Unknown")
-                from_name = from_info.get("name", from_address)
-                subject = email.get("subject", "No subject")
-                date = email.get("receivedDateTime", "")[:19].replace("T", " ")
-
-                print(f"{i:2d}. {read_status}{attachment_status} {subject}")
-                print(f"     From: {from_name} | Date: {date} | ID: {email['id']}")
-
-            return emails
-        else:
-            print(f"❌ Failed to get emails: {response.status_code} - {response.text}")
-            return []
-    except Exception as e:
-        print(f"❌ Error getting emails: {str(e)}")
-        return []
+        print(f"\n📥 Emails in {folder}:")
+        for i, email in enumerate(_take(access_token, endpoint, params, top), 1):
+            emails.append(email)
+            read_status = "📖" if email.get("isRead", False) else "📨"
+            attachment_status = "📎" if email.get("hasAttachments", False) else ""
+            from_info = (email.get("from") or _EMPTY).get("emailAddress") or _EMPTY
+            from_address = from_info.get("address", "Unknown")
+            from_name = from_info.get("name", from_address)
+            subject = email.get("subject", "No subject")
+            date = email.get("receivedDateTime", "")[:19].replace("T", " ")
+
+            sys.stdout.write(
+                f"{i:2d}. {read_status}{attachment_status} {subject}\n"
+                f"     From: {from_name} | Date: {date} | ID: {email['id']}\n"
+            )
+
+        print(f"📥 Found {len(emails)} emails in {folder}")
+    except requests.HTTPError as e:
+        print(f"❌ Failed to get emails: {e.response.status_code} - {e.response.text}")
+
+    return emails
 
 
 def get_email_content(access_token, message_id):
     """Получает полное содержимое письма"""
     endpoint = f"https://graph.microsoft.com/v1.0/{MAILBOX}/messages/{message_id}"
-    params = {
-        "$select": "id,subject,from,toRecipients,ccRecipients,bccRecipients,body,receivedDateTime,bodyPreview,hasAttachments,importance"
-    }
+    params = {"$select": EMAIL_CONTENT_FIELDS}
 
-    headers = {"Authorization": "Bearer " + access_token}
+    headers = {
+        "Authorization": "Bearer " + access_token,
+        "Prefer": PREFER_TEXT_BODY,
+    }
 
-    try:
-        response = requests.get(endpoint, headers=headers, params=params)
-        if response.status_code == 200:
-            email_data = response.json()
-            return process_email_content(email_data)
-        else:
-            print(
-                f"❌ Failed to get email content: {response.status_code} - {response.text}"
-            )
-            return None
-    except Exception as e:
-        print(f"❌ Error getting email content: {str(e)}")
+    response = SESSION.get(endpoint, headers=headers, params=params)
+    if response.status_code == 200:
+        email_data = orjson.loads(response.content)
+        return process_email_content(email_data)
+    else:
+        print(
+            f"❌ Failed to get email content: {response.status_code} - {response.text}"
+        )
         return None
 
 
+@dataclass(slots=True)
+class EmailContent:
+    """Содержимое письма, подготовленное для отображения"""
+
+    id: str | None
+    subject: str
+    from_address: str
+    from_name: str
+    to_recipients: list[str]
+    cc_recipients: list[str]
+    bcc_recipients: list[str]
+    received_date: str | None
+    content_type: str
+    readable_content: str
+    body_preview: str
+    has_attachments: bool
+    attachments_info: list[dict[str, str]]
+    importance: str
+
+
+def _addrs(recipients):
+    """Возвращает адреса получателей из списка Graph recipient"""
+    return [
+        (recipient.get("emailAddress") or _EMPTY).get("address", "")
+        for recipient in recipients or ()
+    ]
+
+
 def process_email_content(email_data):
     """Обрабатывает данные письма для отображения"""
-    body = email_data.get("body", {})
+    body = email_data.get("body") or _EMPTY
     content_type = body.get("contentType", "text")
     content = body.get("content", "")
 
-    # Конвертируем HTML в читаемый текст
+    # Конвертируем HTML в читаемый текст, если сервер не выполнил Prefer,
+    # и заодно извлекаем информацию о вложениях
     if content_type == "html":
-        readable_content = HTMLToTextConverter.convert(content)
+        readable_content, attachments_info = (
+            HTMLToTextConverter.convert_with_attachments(content)
+        )
     else:
         readable_content = content
-
-    # Извлекаем информацию о вложениях
-    attachments_info = []
-    if content_type == "html":
-        attachments_info = HTMLToTextConverter.extract_attachments_info(content)
-
-    return {
-        "id": email_data.get("id"),
-        "subject": email_data.get("subject", "No subject"),
-        "from": email_data.get("from", {})
-        .get("emailAddress", {})
-        .get("address", "Unknown"),
-        "from_name": email_data.get("from", {}).get("emailAddress", {}).get("name", ""),
-        "to_recipients": [
-            recipient.get("emailAddress", {}).get("address", "")
-            for recipient in email_data.get("toRecipients", [])
-        ],
-        "cc_recipients": [
-            recipient.get("emailAddress", {}).get("address", "")
-            for recipient in email_data.get("ccRecipients", [])
-        ],
-        "bcc_recipients": [
-            recipient.get("emailAddress", {}).get("address", "")
-            for recipient in email_data.get("bccRecipients", [])
-        ],
-        "received_date": email_data.get("receivedDateTime"),
-        "content_type": content_type,
-        "readable_content": readable_content,
-        "body_preview": email_data.get("bodyPreview", ""),
-        "has_attachments": email_data.get("hasAttachments", False),
-        "attachments_info": attachments_info,
-        "importance": email_data.get("importance", "normal"),
-    }
+        attachments_info = HTMLToTextConverter.extract_attachments_from_text(content)
+
+    from_info = (email_data.get("from") or _EMPTY).get("emailAddress") or _EMPTY
+
+    return EmailContent(
+        id=email_data.get("id"),
+        subject=email_data.get("subject", "No subject"),
+        from_address=from_info.get("address", "Unknown"),
+        from_name=from_info.get("name", ""),
+        to_recipients=_addrs(email_data.get("toRecipients")),
+        cc_recipients=_addrs(email_data.get("ccRecipients")),
+        bcc_recipients=_addrs(email_data.get("bccRecipients")),
+        received_date=email_data.get("receivedDateTime"),
+        content_type=content_type,
+        readable_content=readable_content,
+        body_preview=email_data.get("bodyPreview", ""),
+        has_attachments=email_data.get("hasAttachments", False),
+        attachments_info=attachments_info,
+        importance=email_data.get("importance", "normal"),
+    )
 
 
 def display_email_content(email_content):
@@ -213,49 +364,54 @@ def display_email_content(email_content):
         print("❌ No email content to display")
         return
 
+    # Собираем вывод целиком и пишем одним вызовом
+    lines = []
+
     # Заголовок
-    print("\n" + "=" * 80)
+    lines.append("\n" + "=" * 80)
     importance_symbol = (
         "🔴"
-        if email_content["importance"] == "high"
-        else "🟡" if email_content["importance"] == "low" else "🔵"
+        if email_content.importance == "high"
+        else "🟡" if email_content.importance == "low" else "🔵"
     )
-    print(f"{importance_symbol} SUBJECT: {email_content['subject']}")
-    print("=" * 80)
+    lines.append(f"{importance_symbol} SUBJECT: {email_content.subject}")
+    lines.append("=" * 80)
 
     # Информация об отправителе и получателях
-    print(f"📧 FROM: {email_content['from_name']} <{email_content['from']}>")
-    print(f"📨 TO: {', '.join(email_content['to_recipients'])}")
+    lines.append(f"📧 FROM: {email_content.from_name} <{email_content.from_address}>")
+    lines.append(f"📨 TO: {', '.join(email_content.to_recipients)}")
 
-    if email_content["cc_recipients"]:
-        print(f"📋 CC: {', '.join(email_content['cc_recipients'])}")
+    if email_content.cc_recipients:
+        lines.append(f"📋 CC: {', '.join(email_content.cc_recipients)}")
 
-    if email_content["bcc_recipients"]:
-        print(f"📋 BCC: {len(email_content['bcc_recipients'])} recipients")
+    if email_content.bcc_recipients:
+        lines.append(f"📋 BCC: {len(email_content.bcc_recipients)} recipients")
 
-    print(f"📅 DATE: {email_content['received_date']}")
+    lines.append(f"📅 DATE: {email_content.received_date}")
 
     # Информация о вложениях
-    attachment_status = "✅ Yes" if email_content["has_attachments"] else "❌ No"
-    print(f"📎 ATTACHMENTS: {attachment_status}")
+    attachment_status = "✅ Yes" if email_content.has_attachments else "❌ No"
+    lines.append(f"📎 ATTACHMENTS: {attachment_status}")
 
-    if email_content["attachments_info"]:
-        print(f"📋 MENTIONED ATTACHMENTS: {len(email_content['attachments_info'])}")
-        for att in email_content["attachments_info"]:
-            print(f"   - {att['name']}")
+    if email_content.attachments_info:
+        lines.append(f"📋 MENTIONED ATTACHMENTS: {len(email_content.attachments_info)}")
+        for att in email_content.attachments_info:
+            lines.append(f"   - {att['name']}")
 
-    print("-" * 80)
+    lines.append("-" * 80)
 
     # Preview если есть
-    if email_content["body_preview"]:
-        print(f"📝 PREVIEW: {email_content['body_preview']}")
-        print("-" * 80)
+    if email_content.body_preview:
+        lines.append(f"📝 PREVIEW: {email_content.body_preview}")
+        lines.append("-" * 80)
 
     # Основное содержимое
-    print("📄 CONTENT:")
-    print("-" * 80)
-    print(email_content["readable_content"])
-    print("=" * 80)
+    lines.append("📄 CONTENT:")
+    lines.append("-" * 80)
+    lines.append(email_content.readable_content)
+    lines.append("=" * 80)
+
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def delete_email(access_token, message_id):
@@ -264,18 +420,12 @@ def delete_email(access_token, message_id):
 
     headers = {"Authorization": "Bearer " + access_token}
 
-    try:
-        response = requests.delete(endpoint, headers=headers)
-        if response.status_code == 204:
-            print("✅ Email deleted successfully!")
-            return True
-        else:
-            print(
-                f"❌ Failed to delete email: {response.status_code} - {response.text}"
-            )
-            return False
-    except Exception as e:
-        print(f"❌ Error deleting email: {str(e)}")
+    response = SESSION.delete(endpoint, headers=headers)
+    if response.status_code == 204:
+        print("✅ Email deleted successfully!")
+        return True
+    else:
+        print(f"❌ Failed to delete email: {response.status_code} - {response.text}")
         return False
 
 
@@ -290,58 +440,183 @@ def move_email_to_trash(access_token, message_id):
 
     data = {"destinationId": "deleteditems"}
 
-    try:
-        response = requests.post(endpoint, headers=headers, json=data)
-        if response.status_code == 201:
-            print("✅ Email moved to trash successfully!")
-            return True
-        else:
-            print(
-                f"❌ Failed to move email to trash: {response.status_code} - {response.text}"
-            )
-            return False
-    except Exception as e:
-        print(f"❌ Error moving email to trash: {str(e)}")
+    response = SEND_SESSION.post(endpoint, headers=headers, json=data)
+    if response.status_code == 201:
+        print("✅ Email moved to trash successfully!")
+        return True
+    else:
+        print(
+            f"❌ Failed to move email to trash: {response.status_code} - {response.text}"
+        )
         return False
 
 
-def search_emails(access_token, query, top=10):
-    """Ищет письма по запросу"""
-    endpoint = f"https://graph.microsoft.com/v1.0/{MAILBOX}/messages"
-    params = {
-        "$top": top,
-        "$search": f'"{query}"',
-        "$select": "id,subject,from,receivedDateTime,isRead,hasAttachments",
-    }
+def _batch_request(access_token, sub_requests, session=SESSION):
+    """
+    Отправляет подзапросы через JSON batching пачками по BATCH_LIMIT
+
+    Args:
+        access_token (str): Токен доступа
+        sub_requests (list): Подзапросы с уникальными "id"
+        session (requests.Session): Сессия, задающая политику повторов
 
+    Returns:
+        dict: Ответы подзапросов по их "id"
+    """
     headers = {
         "Authorization": "Bearer " + access_token,
         "Content-Type": "application/json",
     }
 
+    responses = {}
+    for start in range(0, len(sub_requests), BATCH_LIMIT):
+        pending = sub_requests[start : start + BATCH_LIMIT]
+        for attempt in range(BATCH_RETRIES + 1):
+            payload = {"requests": pending}
+            response = session.post(BATCH_ENDPOINT, headers=headers, json=payload)
+            if response.status_code != 200:
+                print(
+                    f"❌ Batch request failed: {response.status_code} - {response.text}"
+                )
+                break
+
+            throttled = set()
+            delay = 0
+            for sub_response in orjson.loads(response.content).get("responses", []):
+                responses[sub_response["id"]] = sub_response
+                if sub_response.get("status") == 429:
+                    throttled.add(sub_response["id"])
+                    delay = max(delay, _retry_after(sub_response))
+
+            if not throttled or attempt == BATCH_RETRIES:
+                break
+
+            # Повторяем только затроттленные подзапросы после наибольшего Retry-After
+            time.sleep(delay)
+            pending = [request for request in pending if request["id"] in throttled]
+
+    return responses
+
+
+def _retry_after(sub_response):
+    """Возвращает задержку из заголовка Retry-After подответа $batch в секундах"""
+    value = (sub_response.get("headers") or _EMPTY).get("Retry-After")
     try:
-        response = requests.get(endpoint, headers=headers, params=params)
-        if response.status_code == 200:
-            emails = response.json().get("value", [])
-            print(f"\n🔍 Found {len(emails)} emails for query '{query}':")
-
-            for i, email in enumerate(emails, 1):
-                read_status = "📖" if email.get("isRead", False) else "📨"
-                attachment_status = "📎" if email.get("hasAttachments", False) else ""
-                from_info = email.get("from", {}).get("emailAddress", {})
-                from_address = from_info.get("address", "Unknown")
-                subject = email.get("subject", "No subject")
-
-                print(f"{i:2d}. {read_status}{attachment_status} {subject}")
-                print(f"     From: {from_address} | ID: {email['id']}")
-
-            return emails
+        return float(value)
+    except (TypeError, ValueError):
+        return BATCH_RETRY_DELAY
+
+
+def _batch_apply(
+    access_token, message_ids, build_request, success_status, action, session=SESSION
+):
+    """Выполняет одну операцию над списком писем и возвращает ID успешных"""
+    sub_requests = [
+        {"id": str(i), **build_request(message_id)}
+        for i, message_id in enumerate(message_ids)
+    ]
+    responses = _batch_request(access_token, sub_requests, session)
+
+    succeeded = []
+    for i, message_id in enumerate(message_ids):
+        status = responses.get(str(i), {}).get("status")
+        if status == success_status:
+            succeeded.append(message_id)
         else:
-            print(f"❌ Search failed: {response.status_code} - {response.text}")
-            return []
-    except Exception as e:
-        print(f"❌ Error searching emails: {str(e)}")
-        return []
+            print(f"❌ Failed to {action} {message_id}: {status}")
+
+    return succeeded
+
+
+def batch_delete_emails(access_token, message_ids):
+    """Удаляет несколько писем через $batch"""
+    deleted = _batch_apply(
+        access_token,
+        message_ids,
+        lambda message_id: {
+            "method": "DELETE",
+            "url": f"/{MAILBOX}/messages/{message_id}",
+        },
+        204,
+        "delete",
+    )
+    print(f"✅ Deleted {len(deleted)}/{len(message_ids)} emails")
+    return deleted
+
+
+def batch_move_to_trash(access_token, message_ids):
+    """Перемещает несколько писем в корзину через $batch"""
+    moved = _batch_apply(
+        access_token,
+        message_ids,
+        lambda message_id: {
+            "method": "POST",
+            "url": f"/{MAILBOX}/messages/{message_id}/move",
+            "headers": {"Content-Type": "application/json"},
+            "body": {"destinationId": "deleteditems"},
+        },
+        201,
+        "move to trash",
+        # Перемещение неидемпотентно: повторяем только при троттлинге
+        SEND_SESSION,
+    )
+    print(f"✅ Moved {len(moved)}/{len(message_ids)} emails to trash")
+    return moved
+
+
+def batch_get_email_content(access_token, message_ids):
+    """Получает содержимое нескольких писем через $batch"""
+    sub_requests = [
+        {
+            "id": str(i),
+            "method": "GET",
+            "url": f"/{MAILBOX}/messages/{message_id}?$select={EMAIL_CONTENT_FIELDS}",
+            "headers": {"Prefer": PREFER_TEXT_BODY},
+        }
+        for i, message_id in enumerate(message_ids)
+    ]
+    responses = _batch_request(access_token, sub_requests)
+
+    contents = []
+    for i, message_id in enumerate(message_ids):
+        sub_response = responses.get(str(i), {})
+        if sub_response.get("status") == 200:
+            contents.append(process_email_content(sub_response["body"]))
+        else:
+            print(
+                f"❌ Failed to get email content {message_id}: {sub_response.get('status')}"
+            )
+            contents.append(None)
+
+    return contents
+
+
+def search_emails(access_token, query, top=10):
+    """Ищет письма по запросу"""
+    endpoint = f"https://graph.microsoft.com/v1.0/{MAILBOX}/messages"
+    params = {"$search": f'"{query}"', "$select": LISTING_FIELDS}
+
+    emails = []
+    try:
+        print(f"\n🔍 Emails for query '{query}':")
+        for i, email in enumerate(_take(access_token, endpoint, params, top), 1):
+            emails.append(email)
+            read_status = "📖" if email.get("isRead", False) else "📨"
+            attachment_status = "📎" if email.get("hasAttachments", False) else ""
+            from_info = (email.get("from") or _EMPTY).get("emailAddress") or _EMPTY
+            from_address = from_info.get("address", "Unknown")
+            subject = email.get("subject", "No subject")
+
+            sys.stdout.write(
+                f"{i:2d}. {read_status}{attachment_status} {subject}\n"
+                f"     From: {from_address} | ID: {email['id']}\n"
+            )
+
+        print(f"🔍 Found {len(emails)} emails for query '{query}'")
+    except requests.HTTPError as e:
+        print(f"❌ Search failed: {e.response.status_code} - {e.response.text}")
+
+    return emails
 
 
 def get_folders(access_token):
@@ -350,19 +625,15 @@ def get_folders(access_token):
 
     headers = {"Authorization": "Bearer " + access_token}
 
-    try:
-        response = requests.get(endpoint, headers=headers)
-        if response.status_code == 200:
-            folders = response.json().get("value", [])
-            print("\n📁 Available folders:")
-            for folder in folders:
-                print(f"  - {folder['displayName']} (ID: {folder['id']})")
-            return folders
-        else:
-            print(f"❌ Failed to get folders: {response.status_code} - {response.text}")
-            return []
-    except Exception as e:
-        print(f"❌ Error getting folders: {str(e)}")
+    response = SESSION.get(endpoint, headers=headers)
+    if response.status_code == 200:
+        folders = orjson.loads(response.content).get("value", [])
+        print("\n📁 Available folders:")
+        for folder in folders:
+            print(f"  - {folder['displayName']} (ID: {folder['id']})")
+        return folders
+    else:
+        print(f"❌ Failed to get folders: {response.status_code} - {response.text}")
         return []
 
 
@@ -372,17 +643,9 @@ def main():
     print("Initializing...")
 
     # Получаем токен
-    result = acquire_token()
-
-    if "access_token" not in result:
-        print(
-            "❌ Authentication failed:",
-            result.get("error"),
-            result.get("error_description"),
-        )
+    if not current_access_token():
         return
 
-    access_token = result["access_token"]
     print("✅ Authentication successful!")
 
     # Главный цикл
@@ -401,86 +664,146 @@ def main():
 
         choice = input("\nSelect option (1-8): ").strip()
 
-        if choice == "1":
-            # Отправка письма
-            subject = input("Enter subject: ").strip()
-            body = input("Enter message: ").strip()
-            to_emails = input("Enter recipient emails (comma separated): ").split(",")
-            to_emails = [email.strip() for email in to_emails if email.strip()]
+        # Ошибки сети после исчерпания повторов не прерывают работу клиента
+        try:
+            if choice == "1":
+                # Отправка письма
+                subject = input("Enter subject: ").strip()
+                body = input("Enter message: ").strip()
+                to_emails = input("Enter recipient emails (comma separated): ").split(
+                    ","
+                )
+                to_emails = [email.strip() for email in to_emails if email.strip()]
+
+                cc_emails = input(
+                    "Enter CC emails (comma separated, optional): "
+                ).split(",")
+                cc_emails = [email.strip() for email in cc_emails if email.strip()]
+
+                if not to_emails:
+                    print("❌ At least one recipient is required")
+                    continue
+
+                access_token = current_access_token()
+                if not access_token:
+                    continue
+
+                send_mail(
+                    access_token,
+                    subject,
+                    body,
+                    to_emails,
+                    cc_emails if cc_emails else None,
+                )
 
-            cc_emails = input("Enter CC emails (comma separated, optional): ").split(
-                ","
-            )
-            cc_emails = [email.strip() for email in cc_emails if email.strip()]
+            elif choice == "2":
+                # Чтение inbox
+                limit = input("Number of emails to show (default 10): ").strip()
+                try:
+                    limit = int(limit) if limit else 10
+                except ValueError:
+                    limit = 10
 
-            if not to_emails:
-                print("❌ At least one recipient is required")
-                continue
+                access_token = current_access_token()
+                if not access_token:
+                    continue
 
-            send_mail(
-                access_token, subject, body, to_emails, cc_emails if cc_emails else None
-            )
+                get_emails(access_token, top=limit)
 
-        elif choice == "2":
-            # Чтение inbox
-            limit = input("Number of emails to show (default 10): ").strip()
-            try:
-                limit = int(limit) if limit else 10
-            except ValueError:
-                limit = 10
-
-            emails = get_emails(access_token, top=limit)
-
-        elif choice == "3":
-            # Чтение содержимого письма
-            message_id = input("Enter message ID: ").strip()
-            if message_id:
-                email_content = get_email_content(access_token, message_id)
-                if email_content:
-                    display_email_content(email_content)
-            else:
-                print("❌ Message ID is required")
-
-        elif choice == "4":
-            # Полное удаление письма
-            message_id = input("Enter message ID to delete: ").strip()
-            if message_id:
-                confirm = (
-                    input("⚠️ Are you sure? This cannot be undone! (y/n): ")
-                    .strip()
-                    .lower()
+            elif choice == "3":
+                # Чтение содержимого писем
+                message_ids = input("Enter message ID(s) (comma separated): ").split(
+                    ","
                 )
-                if confirm == "y":
-                    delete_email(access_token, message_id)
-            else:
-                print("❌ Message ID is required")
-
-        elif choice == "5":
-            # Перемещение в корзину
-            message_id = input("Enter message ID to move to trash: ").strip()
-            if message_id:
-                move_email_to_trash(access_token, message_id)
-            else:
-                print("❌ Message ID is required")
+                message_ids = [mid.strip() for mid in message_ids if mid.strip()]
+                if message_ids:
+                    access_token = current_access_token()
+                    if not access_token:
+                        continue
+                    # Несколько писем запрашиваются пачками через $batch
+                    if len(message_ids) == 1:
+                        email_contents = [
+                            get_email_content(access_token, message_ids[0])
+                        ]
+                    else:
+                        email_contents = batch_get_email_content(
+                            access_token, message_ids
+                        )
+                    for email_content in email_contents:
+                        if email_content:
+                            display_email_content(email_content)
+                else:
+                    print("❌ Message ID is required")
+
+            elif choice == "4":
+                # Полное удаление писем
+                message_ids = input(
+                    "Enter message ID(s) to delete (comma separated): "
+                ).split(",")
+                message_ids = [mid.strip() for mid in message_ids if mid.strip()]
+                if message_ids:
+                    confirm = (
+                        input("⚠️ Are you sure? This cannot be undone! (y/n): ")
+                        .strip()
+                        .lower()
+                    )
+                    if confirm == "y":
+                        access_token = current_access_token()
+                        if not access_token:
+                            continue
+                        if len(message_ids) == 1:
+                            delete_email(access_token, message_ids[0])
+                        else:
+                            batch_delete_emails(access_token, message_ids)
+                else:
+                    print("❌ Message ID is required")
+
+            elif choice == "5":
+                # Перемещение в корзину
+                message_ids = input(
+                    "Enter message ID(s) to move to trash (comma separated): "
+                ).split(",")
+                message_ids = [mid.strip() for mid in message_ids if mid.strip()]
+                if not message_ids:
+                    print("❌ Message ID is required")
+                    continue
+
+                access_token = current_access_token()
+                if not access_token:
+                    continue
+
+                if len(message_ids) == 1:
+                    move_email_to_trash(access_token, message_ids[0])
+                else:
+                    batch_move_to_trash(access_token, message_ids)
+
+            elif choice == "6":
+                # Поиск писем
+                query = input("Enter search query: ").strip()
+                if query:
+                    access_token = current_access_token()
+                    if not access_token:
+                        continue
+                    search_emails(access_token, query)
+                else:
+                    print("❌ Search query is required")
+
+            elif choice == "7":
+                # Список папок
+                access_token = current_access_token()
+                if not access_token:
+                    continue
+
+                get_folders(access_token)
+
+            elif choice == "8":
+                print("👋 Goodbye!")
+                break
 
-        elif choice == "6":
-            # Поиск писем
-            query = input("Enter search query: ").strip()
-            if query:
-                search_emails(access_token, query)
             else:
-                print("❌ Search query is required")
-
-        elif choice == "7":
-            # Список папок
-            get_folders(access_token)
-
-        elif choice == "8":
-            print("👋 Goodbye!")
-            break
-
-        else:
-            print("❌ Invalid option. Please try again.")
+                print("❌ Invalid option. Please try again.")
+        except requests.RequestException as e:
+            print(f"❌ Network error: {str(e)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+"""Проверки HTMLToTextConverter на типичных письмах для обоих парсеров"""
+
+import pytest
+
+import html_converter
+from html_converter import HTMLToTextConverter
+
+SAMPLES = [
+    (
+        "<html><head><style>p{color:red}</style><title>T</title></head><body>"
+        "<h1>Hello</h1><p>First   para</p><p>Second</p>"
+        "<ul><li>a</li><li>b</li></ul><ol><li>x</li><li></li><li>z</li></ol>"
+        "<table><tr><th>H1</th><th>H2</th></tr><tr><td>1</td><td>2</td></tr></table>"
+        "<a href='http://x.com/f.pdf'>Download file</a> "
+        "<a href='http://y.com'>http://y.com</a><br>line<br/>next"
+        "<div>plain div</div><div><p>inner</p></div>"
+        "<script>var a=1;</script></body></html>",
+        "====== HELLO\n=======\n\nFirst para\n\nSecond\n\n• a\n• b\n\n1. x\n3. z\n\n"
+        "H1 | H2\n1 | 2\nDownload file [http://x.com/f.pdf] http://y.com\n"
+        "line\nnext\nplain div\n\ninner",
+        [{"name": "Download file", "url": "http://x.com/f.pdf"}],
+    ),
+    ("Just plain text &amp; stuff\n\n\n\nmore", "Just plain text & stuff\n\nmore", []),
+    ("<html><body>Hello<br>World</body></html>", "Hello\nWorld", []),
+    (
+        "<div><h2>Title <a href='u'>link</a></h2><p>text with <b>bold</b> and "
+        "<a href='https://dl'>Вложение отчёт</a></p></div>",
+        "===== TITLE LINK\n======\n\ntext with bold and Вложение отчёт [https://dl]",
+        [{"name": "Вложение отчёт", "url": "https://dl"}],
+    ),
+    ("<p>One</p><p>Two</p>", "One\n\nTwo", []),
+    ("", "", []),
+    (
+        "<html><body>Hello <b>there</b>\nfriend &amp; a < b</body></html>",
+        "Hello there\nfriend & a < b",
+        [],
+    ),
+    (
+        "<html><head><style>x{}</style></head><body><span>Hi</span></body></html>",
+        "Hi",
+        [],
+    ),
+    ("<div>A</div><div>B</div>", "A\n\nB", []),
+    ("<div><div>Inner</div><p>para</p></div>", "Inner\npara", []),
+    (
+        "<table><tr><td><h1>Weekly news</h1><p>Body</p></td></tr></table>",
+        "====== WEEKLY NEWS\n=======\nBody",
+        [],
+    ),
+    ("<ul><li><h2>Item</h2>text</li></ul>", "• ===== ITEM\n======\ntext", []),
+    ("<!-- c --><span>x</span>  <i>y</i>", "x y", []),
+    (
+        "<!--[if gte mso 9]><xml><o:OfficeDocumentSettings>"
+        "<o:PixelsPerInch>96</o:PixelsPerInch></o:OfficeDocumentSettings>"
+        "</xml><![endif]--><span>Hello team</span>",
+        "Hello team",
+        [],
+    ),
+    ("<!-- if a>b show -->Text", "Text", []),
+    ("Text<!-- unclosed", "Text", []),
+]
+
+
+@pytest.fixture(params=["bs4", "selectolax"])
+def parser(request, monkeypatch):
+    """Переключает конвертер между BeautifulSoup и selectolax"""
+    if request.param == "bs4":
+        monkeypatch.setattr(html_converter, "LexborHTMLParser", None)
+    elif html_converter.LexborHTMLParser is None:
+        pytest.skip("selectolax не установлен")
+    return request.param
+
+
+@pytest.mark.parametrize("html, text, attachments", SAMPLES)
+def test_convert_with_attachments(parser, html, text, attachments):
+    assert HTMLToTextConverter.convert_with_attachments(html) == (text, attachments)
+    assert HTMLToTextConverter.convert(html) == text
+
+
+def test_deeply_nested_markup(parser):
+    html = "<div><span>" * 3000 + "deep" + "</span></div>" * 3000
+    assert HTMLToTextConverter.convert(html) == "deep"
+
+
+def test_extract_attachments_from_text():
+    text = (
+        "Hi,\r\nDownload file<http://x.com/f.pdf> and site<https://y.com>\r\n"
+        "Вложение отчёт<https://dl/a.xlsx>\r\n"
+    )
+    assert HTMLToTextConverter.extract_attachments_from_text(text) == [
+        {"name": "Download file", "url": "http://x.com/f.pdf"},
+        {"name": "Вложение отчёт", "url": "https://dl/a.xlsx"},
+    ]